@@ -12,21 +12,180 @@ user_data = {
 # 將資料轉換為DataFrame
 df = pd.DataFrame(user_data)
 
+# 近似最近鄰索引（只用NumPy）：隨機超平面LSH，適用於cosine距離。
+# 每個雜湊表用 n_bits 個隨機超平面把向量分桶，查詢時檢查 n_tables 個表中同桶的向量，
+# 並額外探測 n_probes 個最接近超平面的位元翻轉後的桶（multi-probe），最後用精確cosine重新排序。
+# n_tables、n_probes 越大召回率越高但越慢；n_bits 越大桶越小、越快但召回率越低。
+# 介面與 NearestNeighbors 的 fit/kneighbors 相同，並支援 add 增量加入。
+class LSHIndex:
+    def __init__(self, n_neighbors=2, n_tables=8, n_bits=12, n_probes=2, seed=0):
+        self.n_neighbors = n_neighbors
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.n_probes = n_probes
+        self.seed = seed
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=float)
+        rng = np.random.default_rng(self.seed)
+        self.planes = rng.standard_normal((X.shape[1], self.n_tables * self.n_bits))
+        self.vectors = np.empty((0, X.shape[1]))
+        self.sorted_keys = [np.empty(0, dtype=np.int64) for _ in range(self.n_tables)]
+        self.sorted_ids = [np.empty(0, dtype=np.int64) for _ in range(self.n_tables)]
+        self.add(X)
+        return self
+
+    @staticmethod
+    def _normalize(X):
+        norms = np.linalg.norm(X, axis=1, keepdims=True)
+        return X / np.where(norms == 0, 1, norms)
+
+    def _hash(self, X):
+        projections = (X @ self.planes).reshape(len(X), self.n_tables, self.n_bits)
+        keys = (projections > 0) @ (1 << np.arange(self.n_bits, dtype=np.int64))
+        return keys, projections
+
+    def add(self, X):
+        X = self._normalize(np.asarray(X, dtype=float))
+        ids = np.arange(len(self.vectors), len(self.vectors) + len(X))
+        self.vectors = np.vstack([self.vectors, X])
+        keys, _ = self._hash(X)
+        for t in range(self.n_tables):
+            order = np.argsort(keys[:, t], kind='stable')
+            new_keys = keys[order, t]
+            positions = np.searchsorted(self.sorted_keys[t], new_keys, side='right')
+            self.sorted_keys[t] = np.insert(self.sorted_keys[t], positions, new_keys)
+            self.sorted_ids[t] = np.insert(self.sorted_ids[t], positions, ids[order])
+        return ids
+
+    def kneighbors(self, X, n_neighbors=None):
+        k = n_neighbors or self.n_neighbors
+        X = self._normalize(np.asarray(X, dtype=float))
+        keys, projections = self._hash(X)
+        probe_keys = keys[:, :, None]
+        if self.n_probes:
+            flips = np.argsort(np.abs(projections), axis=2)[:, :, :self.n_probes]
+            probe_keys = np.concatenate([probe_keys, probe_keys ^ (1 << flips)], axis=2)
+        bounds = [(np.searchsorted(self.sorted_keys[t], probe_keys[:, t], side='left'),
+                   np.searchsorted(self.sorted_keys[t], probe_keys[:, t], side='right'))
+                  for t in range(self.n_tables)]
+
+        distances = np.empty((len(X), k))
+        indices = np.empty((len(X), k), dtype=np.int64)
+        for i in range(len(X)):
+            candidates = np.unique(np.concatenate([
+                self.sorted_ids[t][lo:hi]
+                for t, (los, his) in enumerate(bounds) for lo, hi in zip(los[i], his[i])]))
+            if len(candidates) < k:
+                # 候選不足時退回對這個查詢做精確搜尋
+                candidates = np.arange(len(self.vectors))
+            similarities = self.vectors[candidates] @ X[i]
+            top = np.argpartition(-similarities, k - 1)[:k]
+            top = top[np.argsort(-similarities[top], kind='stable')]
+            indices[i] = candidates[top]
+            distances[i] = 1 - similarities[top]
+        return distances, indices
+
 # 創建一個推薦系統模型
 class RecommenderSystem:
-    def __init__(self, data):
+    # backend='exact' 使用sklearn的暴力搜尋；backend='lsh' 使用上面的 LSHIndex，
+    # ann_params 傳入 n_tables/n_bits/n_probes 等參數調整召回率與速度
+    def __init__(self, data, n_neighbors=2, backend='exact', ann_params=None):
         self.data = data
-        self.model = NearestNeighbors(n_neighbors=2, metric='cosine')
-    
+        if backend == 'exact':
+            self.model = NearestNeighbors(n_neighbors=n_neighbors, metric='cosine')
+        elif backend == 'lsh':
+            self.model = LSHIndex(n_neighbors=n_neighbors, **(ann_params or {}))
+        else:
+            raise ValueError(f"unknown backend: {backend!r}")
+        # 預先建立 user_id → 列位置 的索引，查詢時不必掃描整個欄位
+        self.user_index = pd.Index(data['user_id'])
+        self.features = data[['progress']].to_numpy(dtype=float)
+        self.course_ids = data['course_id'].to_numpy()
+
     def fit(self):
-        self.model.fit(self.data[['progress']])
-    
+        self.model.fit(self.features)
+
+    def add_users(self, new_data):
+        # 增量加入新使用者；LSH索引直接插入，精確索引則重新fit（暴力搜尋的fit只是保存資料）
+        if self.user_index.isin(new_data['user_id']).any():
+            raise ValueError("user_id(s) already present")
+        new_features = new_data[['progress']].to_numpy(dtype=float)
+        self.data = pd.concat([self.data, new_data], ignore_index=True)
+        self.user_index = self.user_index.append(pd.Index(new_data['user_id']))
+        self.features = np.vstack([self.features, new_features])
+        self.course_ids = np.concatenate([self.course_ids, new_data['course_id'].to_numpy()])
+        if hasattr(self.model, 'add'):
+            self.model.add(new_features)
+        else:
+            self.model.fit(self.features)
+
+    def user_rows(self, user_ids):
+        rows = self.user_index.get_indexer(np.asarray(user_ids))
+        if (rows < 0).any():
+            raise KeyError(f"unknown user_id(s): {np.asarray(user_ids)[rows < 0].tolist()}")
+        return rows
+
+    def recommend_many(self, user_ids):
+        # 整批只呼叫一次 kneighbors，再用陣列運算去掉使用者自己
+        rows = self.user_rows(user_ids)
+        _, indices = self.model.kneighbors(self.features[rows])
+        keep = indices != rows[:, None]
+        # 若使用者自己不在鄰居中（距離相同的情況），去掉最遠的一個，使每列長度一致
+        keep[keep.all(axis=1), -1] = False
+        return self.course_ids[indices[keep].reshape(len(rows), -1)]
+
     def recommend(self, user_id):
-        user_index = self.data.index[self.data['user_id'] == user_id].tolist()[0]
-        distances, indices = self.model.kneighbors(self.data[['progress']].iloc[user_index].values.reshape(1, -1))
-        recommendations = self.data.iloc[indices[0]]['course_id'].tolist()
-        recommendations.remove(self.data.iloc[user_index]['course_id'])
-        return recommendations
+        return self.recommend_many([user_id])[0].tolist()
+
+# 基準測試：100萬名使用者時，逐一 recommend 與 recommend_many 的每位使用者耗時
+def benchmark_recommend(n_users=1_000_000, n_queries=1000, seed=0):
+    import time
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        'user_id': rng.permutation(n_users) + 1,
+        'course_id': rng.integers(100, 1100, n_users),
+        'progress': rng.integers(1, 101, n_users),
+    })
+    recommender = RecommenderSystem(data)
+    recommender.fit()
+    user_ids = rng.choice(data['user_id'].to_numpy(), n_queries, replace=False)
+
+    start = time.perf_counter()
+    for user_id in user_ids[:100]:
+        recommender.recommend(user_id)
+    loop = (time.perf_counter() - start) / 100
+
+    start = time.perf_counter()
+    recommender.recommend_many(user_ids)
+    batched = (time.perf_counter() - start) / n_queries
+
+    print(f"{n_users} users: recommend {loop * 1000:.2f} ms/user, "
+          f"recommend_many {batched * 1000:.2f} ms/user ({loop / batched:.1f}x)")
+
+# 基準測試：LSH在不同參數下的 recall@k 與每秒查詢數，對照精確搜尋。
+# 示例資料只有一個特徵（progress），這裡用多維隨機特徵才能看出LSH的效果。
+def benchmark_ann(n_users=200_000, n_features=16, n_queries=1000, k=10, seed=0,
+                  settings=({'n_tables': 4, 'n_bits': 14, 'n_probes': 0},
+                            {'n_tables': 8, 'n_bits': 12, 'n_probes': 2},
+                            {'n_tables': 16, 'n_bits': 10, 'n_probes': 4})):
+    import time
+    rng = np.random.default_rng(seed)
+    features = rng.standard_normal((n_users, n_features))
+    queries = features[rng.choice(n_users, n_queries, replace=False)] + 0.1 * rng.standard_normal((n_queries, n_features))
+
+    exact = NearestNeighbors(n_neighbors=k, metric='cosine').fit(features)
+    start = time.perf_counter()
+    _, truth = exact.kneighbors(queries)
+    print(f"exact: {n_queries / (time.perf_counter() - start):8.0f} q/s, recall@{k} 1.000")
+
+    for params in settings:
+        index = LSHIndex(n_neighbors=k, **params).fit(features)
+        start = time.perf_counter()
+        _, found = index.kneighbors(queries)
+        qps = n_queries / (time.perf_counter() - start)
+        recall = np.mean([len(np.intersect1d(a, b)) / k for a, b in zip(found, truth)])
+        print(f"lsh {params}: {qps:8.0f} q/s, recall@{k} {recall:.3f}")
 
 # 產生實體推薦系統並進行推薦
 recommender = RecommenderSystem(df)
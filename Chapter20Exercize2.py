@@ -1,19 +1,201 @@
+import json
+import os
+import time
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+# 計分時稠密相似度區塊（查詢數 × 文檔數）的元素上限，約128MB的float64；
+# 文檔數很大時自動減少每次計分的查詢數
+MAX_SCORE_ELEMENTS = 2 ** 24
 
 class SimpleRAG:
-    def __init__(self, documents):
-        self.documents = documents
-        self.vectorizer = TfidfVectorizer()
-        self.tfidf_matrix = self.vectorizer.fit_transform(documents)
-    
+    # 使用雜湊特徵（HashingVectorizer），詞彙表固定不變，新增文檔時不需要重新擬合。
+    # 索引保存原始詞頻的CSR矩陣與文檔頻率（df），IDF隨文檔增刪即時更新；
+    # 加權後的TF-IDF矩陣在需要時才重新計算（只做一次稀疏乘法，不重新分詞）。
+    def __init__(self, documents, n_features=2 ** 20, idf_source=None):
+        self.documents = []
+        self.idf_source = idf_source
+        self.vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None)
+        self.doc_freq = np.zeros(n_features, dtype=np.int64)
+        self.n_docs = 0
+        self._alive = np.zeros(0, dtype=bool)
+        self._counts = sp.csr_matrix((0, n_features), dtype=np.float64)
+        self._pending = []
+        self._invalidate()
+        self.add_documents(documents)
+
+    def add_documents(self, documents):
+        documents = list(documents)
+        start = len(self.documents)
+        if not documents:
+            return []
+        counts = self.vectorizer.transform(documents).tocsr()
+        counts.sum_duplicates()
+        self.doc_freq += np.bincount(counts.indices, minlength=self.doc_freq.shape[0])
+        self.n_docs += len(documents)
+        self._writable_documents().extend(documents)
+        self._alive = np.concatenate([self._alive, np.ones(len(documents), dtype=bool)])
+        self._pending.append(counts)
+        self._invalidate()
+        return list(range(start, len(self.documents)))
+
+    def remove_document(self, doc_id):
+        if not 0 <= doc_id < len(self._alive):
+            raise IndexError(f"document {doc_id} does not exist")
+        if not self._alive[doc_id]:
+            raise KeyError(f"document {doc_id} has already been removed")
+        counts = self._consolidate()
+        if not counts.data.flags.writeable:
+            # 從唯讀映射載入的索引，第一次修改時才複製到記憶體
+            self._counts = counts = counts.copy()
+            self._alive = self._alive.copy()
+        row = slice(counts.indptr[doc_id], counts.indptr[doc_id + 1])
+        self.doc_freq[counts.indices[row]] -= 1
+        # 就地清空該列，文檔編號保持不變
+        counts.data[row] = 0
+        self._alive[doc_id] = False
+        self._writable_documents()[doc_id] = None
+        self.n_docs -= 1
+        self._invalidate()
+
+    def _writable_documents(self):
+        if not isinstance(self.documents, list):
+            self.documents = list(self.documents)
+        return self.documents
+
+    def _invalidate(self):
+        self._idf = None
+        self._tfidf = None
+        self._tfidf_t = None
+
+    def _consolidate(self):
+        if self._pending:
+            self._counts = sp.vstack([self._counts] + self._pending, format='csr')
+            self._pending = []
+        return self._counts
+
+    @property
+    def idf(self):
+        # 分片模式下由 idf_source 提供全域IDF
+        if self.idf_source is not None:
+            return self.idf_source.idf
+        # 與 TfidfVectorizer(smooth_idf=True) 相同的公式，快取到索引變動為止
+        if self._idf is None:
+            self._idf = np.log((1 + self.n_docs) / (1 + self.doc_freq)) + 1
+        return self._idf
+
+    @property
+    def tfidf_matrix(self):
+        if self._tfidf is None:
+            tfidf = self._consolidate().copy()
+            tfidf.data *= self.idf[tfidf.indices]
+            # sklearn 的 normalize 不接受0列矩陣；空索引直接保留空矩陣
+            self._tfidf = normalize(tfidf, copy=False) if tfidf.shape[0] else tfidf
+        return self._tfidf
+
+    def _tfidf_transposed(self):
+        # 查詢時用 (查詢 × 詞) @ (詞 × 文檔) 的CSR乘法，轉置結果快取到索引變動為止
+        if self._tfidf_t is None:
+            self._tfidf_t = self.tfidf_matrix.T.tocsr()
+        return self._tfidf_t
+
+    def save(self, path):
+        # 目錄中每個陣列一個 .npy 檔，載入時可以唯讀記憶體映射。
+        # 雜湊特徵沒有詞彙表，只需保存 n_features；查詢用的轉置TF-IDF矩陣也一併保存，
+        # 以便多個行程共用同一份頁面快取。
+        os.makedirs(path, exist_ok=True)
+        counts = self._consolidate()
+        tfidf_t = self._tfidf_transposed()
+        encoded = [(doc or "").encode("utf-8") for doc in self.documents]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(doc) for doc in encoded], out=offsets[1:])
+        arrays = {
+            "doc_freq": self.doc_freq,
+            "idf": self.idf,
+            "alive": self._alive,
+            "counts_data": counts.data,
+            "counts_indices": counts.indices,
+            "counts_indptr": counts.indptr,
+            "tfidf_t_data": tfidf_t.data,
+            "tfidf_t_indices": tfidf_t.indices,
+            "tfidf_t_indptr": tfidf_t.indptr,
+            "documents_blob": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            "documents_offsets": offsets,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + ".npy"), array)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"n_features": self.doc_freq.shape[0], "n_docs": self.n_docs}, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        mmap_mode = "r" if mmap else None
+        arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+                  for name in os.listdir(path) if name.endswith(".npy")}
+        n_features = meta["n_features"]
+        n_rows = arrays["alive"].shape[0]
+
+        rag = cls.__new__(cls)
+        rag.idf_source = None
+        rag.vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None)
+        rag.doc_freq = np.array(arrays["doc_freq"])
+        rag.n_docs = meta["n_docs"]
+        rag._alive = arrays["alive"]
+        rag._counts = sp.csr_matrix(
+            (arrays["counts_data"], arrays["counts_indices"], arrays["counts_indptr"]),
+            shape=(n_rows, n_features), copy=False)
+        rag._pending = []
+        rag._invalidate()
+        # 保存時的IDF（分片模式下為全域IDF），直接作為快取，不必從 doc_freq 重新計算
+        rag._idf = arrays.get("idf")
+        rag._tfidf_t = sp.csr_matrix(
+            (arrays["tfidf_t_data"], arrays["tfidf_t_indices"], arrays["tfidf_t_indptr"]),
+            shape=(n_features, n_rows), copy=False)
+        rag.documents = _MappedDocuments(arrays["documents_blob"], arrays["documents_offsets"], rag._alive)
+        return rag
+
+    def transform(self, queries):
+        query_vecs = self.vectorizer.transform(queries).tocsr()
+        query_vecs.data *= self.idf[query_vecs.indices]
+        return normalize(query_vecs, copy=False)
+
     def retrieve(self, query, k=3):
-        query_vec = self.vectorizer.transform([query])
-        similarities = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
-        top_k_indices = similarities.argsort()[-k:][::-1]
-        return [self.documents[i] for i in top_k_indices]
-    
+        indices, _ = self.retrieve_many([query], k)
+        return [self.documents[i] for i in indices[0]]
+
+    def retrieve_many(self, queries, k=3, batch_size=1024):
+        # 一次轉換所有查詢，每批只做一次稀疏矩陣乘法，再以部分選擇取出前k名
+        queries = list(queries)
+        k = min(k, self.n_docs)
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        scores = np.empty((len(queries), k), dtype=np.float64)
+        for start in range(0, len(queries), batch_size):
+            query_vecs = self.transform(queries[start:start + batch_size])
+            rows = slice(start, start + query_vecs.shape[0])
+            indices[rows], scores[rows] = self.top_k_for_vectors(query_vecs, k)
+        return indices, scores
+
+    def top_k_for_vectors(self, query_vecs, k):
+        # query_vecs 必須是已經用同一份IDF轉換好的查詢向量（見 transform）
+        k = min(k, self.n_docs)
+        indices = np.empty((query_vecs.shape[0], k), dtype=np.int64)
+        scores = np.empty((query_vecs.shape[0], k), dtype=np.float64)
+        if k == 0:
+            # 空索引（或文檔數少於分片數時的空分片）沒有可計分的文檔，也不建立TF-IDF矩陣
+            return indices, scores
+        tfidf_t = self._tfidf_transposed()
+        chunk = max(1, MAX_SCORE_ELEMENTS // max(1, tfidf_t.shape[1]))
+        for start in range(0, query_vecs.shape[0], chunk):
+            rows = slice(start, start + chunk)
+            similarities = (query_vecs[rows] @ tfidf_t).toarray()
+            similarities[:, ~self._alive] = -np.inf
+            indices[rows], scores[rows] = top_k_rows(similarities, k)
+        return indices, scores
+
     def generate_answer(self, query):
         relevant_docs = self.retrieve(query)
         # 這裡你需要實現一個簡單的答案生成邏輯
@@ -21,6 +203,288 @@ class SimpleRAG:
         # 例如，你可以返回最相關文檔的第一句話
         return relevant_docs[0].split('.')[0] + '.'
 
+
+# 記憶體映射的文檔文字：只在取用時才解碼，不必在啟動時建立整個字串列表
+class _MappedDocuments:
+    def __init__(self, blob, offsets, alive):
+        self.blob = blob
+        self.offsets = offsets
+        self.alive = alive
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    def __getitem__(self, i):
+        if not self.alive[i]:
+            return None
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+# 分片檢索：文檔依編號輪流分配到各分片（doc_id % n_shards），
+# 各分片共用全域IDF，因此分數與不分片的 SimpleRAG 完全相同。
+# 查詢只轉換一次，各分片平行計分後再合併全域前k名。
+class ShardedRAG:
+    def __init__(self, documents, n_shards=4, n_features=2 ** 20, executor="thread", max_workers=None):
+        if executor == "process":
+            # 行程模式的工作行程要從已保存的索引記憶體映射載入，只能經由 load() 建立
+            raise ValueError("executor='process' serves a saved index; build a thread-mode index, "
+                             "save() it and open it with ShardedRAG.load(path, executor='process')")
+        self.n_shards = n_shards
+        self.executor = executor
+        self.max_workers = max_workers or n_shards
+        self.shards = [SimpleRAG([], n_features=n_features, idf_source=self) for _ in range(n_shards)]
+        self.n_rows = 0
+        self.path = None
+        self._pool = None
+        self._idf = None
+        self.add_documents(documents)
+
+    def add_documents(self, documents):
+        self._check_writable()
+        documents = list(documents)
+        ids = list(range(self.n_rows, self.n_rows + len(documents)))
+        for shard_id, shard in enumerate(self.shards):
+            first = (shard_id - self.n_rows) % self.n_shards
+            shard.add_documents(documents[first::self.n_shards])
+        self.n_rows += len(documents)
+        self._invalidate()
+        return ids
+
+    def remove_document(self, doc_id):
+        self._check_writable()
+        if not 0 <= doc_id < self.n_rows:
+            raise IndexError(f"document {doc_id} does not exist")
+        self.shards[doc_id % self.n_shards].remove_document(doc_id // self.n_shards)
+        self._invalidate()
+
+    def _check_writable(self):
+        if self.executor == "process":
+            raise RuntimeError("process-mode ShardedRAG serves a saved index read-only; "
+                               "modify a thread-mode index and save it again")
+
+    def _invalidate(self):
+        self._idf = None
+        for shard in self.shards:
+            shard._invalidate()
+
+    @property
+    def n_docs(self):
+        return sum(shard.n_docs for shard in self.shards)
+
+    @property
+    def documents(self):
+        return [self.document(doc_id) for doc_id in range(self.n_rows)]
+
+    def document(self, doc_id):
+        return self.shards[doc_id % self.n_shards].documents[doc_id // self.n_shards]
+
+    @property
+    def idf(self):
+        if self._idf is None:
+            doc_freq = sum(shard.doc_freq for shard in self.shards)
+            self._idf = np.log((1 + self.n_docs) / (1 + doc_freq)) + 1
+        return self._idf
+
+    def transform(self, queries):
+        return self.shards[0].transform(queries)
+
+    def _get_pool(self):
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        if self._pool is None:
+            if self.executor == "process":
+                self._pool = ProcessPoolExecutor(self.max_workers, initializer=_init_shard_worker,
+                                                 initargs=(self.path,))
+            else:
+                # scipy的稀疏乘法與numpy的argpartition會釋放GIL，執行緒可以平行計分
+                self._pool = ThreadPoolExecutor(self.max_workers)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def retrieve(self, query, k=3):
+        indices, _ = self.retrieve_many([query], k)
+        return [self.document(i) for i in indices[0]]
+
+    def retrieve_many(self, queries, k=3, batch_size=1024):
+        queries = list(queries)
+        k = min(k, self.n_docs)
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        scores = np.empty((len(queries), k), dtype=np.float64)
+        if self.executor == "thread":
+            self.idf  # 在分派到執行緒之前先算好全域IDF
+        pool = self._get_pool()
+        for start in range(0, len(queries), batch_size):
+            query_vecs = self.transform(queries[start:start + batch_size])
+            if self.executor == "process":
+                futures = [pool.submit(_score_shard, shard_id, query_vecs, k)
+                           for shard_id in range(self.n_shards)]
+            else:
+                futures = [pool.submit(shard.top_k_for_vectors, query_vecs, k) for shard in self.shards]
+            shard_indices, shard_scores = [], []
+            for shard_id, future in enumerate(futures):
+                local_indices, local_scores = future.result()
+                shard_indices.append(local_indices * self.n_shards + shard_id)
+                shard_scores.append(local_scores)
+            merged_indices = np.hstack(shard_indices)
+            positions, merged_scores = top_k_rows(np.hstack(shard_scores), k)
+            rows = slice(start, start + query_vecs.shape[0])
+            indices[rows] = np.take_along_axis(merged_indices, positions, axis=1)
+            scores[rows] = merged_scores
+        return indices, scores
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for shard_id, shard in enumerate(self.shards):
+            shard.save(os.path.join(path, f"shard_{shard_id}"))
+        with open(os.path.join(path, "shards.json"), "w") as f:
+            json.dump({"n_shards": self.n_shards, "n_rows": self.n_rows}, f)
+
+    @classmethod
+    def load(cls, path, mmap=True, executor="thread", max_workers=None):
+        with open(os.path.join(path, "shards.json")) as f:
+            meta = json.load(f)
+        sharded = cls.__new__(cls)
+        sharded.n_shards = meta["n_shards"]
+        sharded.n_rows = meta["n_rows"]
+        sharded.executor = executor
+        sharded.max_workers = max_workers or sharded.n_shards
+        sharded.path = path
+        sharded._pool = None
+        sharded._idf = None
+        sharded.shards = [SimpleRAG.load(os.path.join(path, f"shard_{shard_id}"), mmap=mmap)
+                          for shard_id in range(sharded.n_shards)]
+        for shard in sharded.shards:
+            shard.idf_source = sharded
+        # 每個分片保存的都是全域IDF
+        sharded._idf = sharded.shards[0]._idf if sharded.shards else None
+        return sharded
+
+# 行程池的每個工作行程以記憶體映射方式載入同一份分片索引
+_worker_index = None
+
+def _init_shard_worker(path):
+    global _worker_index
+    _worker_index = ShardedRAG.load(path, mmap=True)
+
+def _score_shard(shard_id, query_vecs, k):
+    return _worker_index.shards[shard_id].top_k_for_vectors(query_vecs, k)
+
+# 每一列取分數最高的k個（由高到低），用argpartition避免完整排序
+def top_k_rows(scores, k):
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    return (np.take_along_axis(candidates, order, axis=1),
+            np.take_along_axis(candidate_scores, order, axis=1))
+
+# 基準測試用的合成語料
+def make_synthetic_documents(n_docs, words_per_doc=30, vocab_size=50000, seed=0):
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"w{i}" for i in range(vocab_size)])
+    # 近似Zipf分佈的詞頻
+    weights = 1.0 / np.arange(1, vocab_size + 1)
+    weights /= weights.sum()
+    words = rng.choice(vocab, size=(n_docs, words_per_doc), p=weights)
+    return [" ".join(row) for row in words]
+
+# 比較增量加入與整體重新擬合的吞吐量
+def benchmark_ingest(sizes=(10_000, 100_000, 1_000_000), batch_size=1000):
+    for n in sizes:
+        corpus = make_synthetic_documents(n)
+        batch = make_synthetic_documents(batch_size, seed=1)
+
+        rag = SimpleRAG(corpus)
+        start = time.perf_counter()
+        rag.add_documents(batch)
+        rag.tfidf_matrix  # 計入重新加權的成本
+        incremental = time.perf_counter() - start
+
+        start = time.perf_counter()
+        TfidfVectorizer().fit_transform(corpus + batch)
+        refit = time.perf_counter() - start
+
+        print(f"{n:>9} docs: add_documents {batch_size / incremental:10.0f} docs/s, "
+              f"full refit {batch_size / refit:10.0f} docs/s ({refit / incremental:.1f}x)")
+
+# 比較批次查詢與原本逐一查詢（cosine_similarity + 完整argsort）的吞吐量
+def benchmark_retrieve_many(n_docs=100_000, n_queries=2000, k=3):
+    from sklearn.metrics.pairwise import cosine_similarity
+    rag = SimpleRAG(make_synthetic_documents(n_docs))
+    queries = make_synthetic_documents(n_queries, words_per_doc=5, seed=2)
+    rag.tfidf_matrix
+
+    start = time.perf_counter()
+    for query in queries:
+        similarities = cosine_similarity(rag.transform([query]), rag.tfidf_matrix).flatten()
+        similarities.argsort()[-k:][::-1]
+    loop = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rag.retrieve_many(queries, k)
+    batched = time.perf_counter() - start
+
+    print(f"{n_docs} docs, {n_queries} queries: per-query loop {n_queries / loop:.0f} q/s, "
+          f"retrieve_many {n_queries / batched:.0f} q/s ({loop / batched:.1f}x)")
+
+# 目前的常駐記憶體（Linux /proc）
+def _current_rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+# 在新的（spawn）行程中測量啟動時間與RSS增量（扣除匯入套件的基線）
+def _startup_probe(mode, path, n_docs):
+    corpus = make_synthetic_documents(n_docs) if mode == "fit" else None
+    baseline = _current_rss_mb()
+    start = time.perf_counter()
+    if mode == "fit":
+        rag = SimpleRAG(corpus)
+    else:
+        rag = SimpleRAG.load(path, mmap=(mode == "mmap"))
+    rag.retrieve("w1 w2 w3")
+    elapsed = time.perf_counter() - start
+    return elapsed, _current_rss_mb() - baseline
+
+def benchmark_startup(n_docs=100_000, path="simple_rag_index"):
+    import multiprocessing
+    SimpleRAG(make_synthetic_documents(n_docs)).save(path)
+    ctx = multiprocessing.get_context("spawn")
+    for mode in ("fit", "load", "mmap"):
+        with ctx.Pool(1) as pool:
+            elapsed, rss_mb = pool.apply(_startup_probe, (mode, path, n_docs))
+        print(f"{n_docs} docs, {mode:>4}: startup + first query {elapsed * 1000:8.1f} ms, "
+              f"RSS + {rss_mb:7.1f} MB")
+
+# 分片數（執行緒數）從1到全部核心的擴展性，並確認分數與不分片時一致
+def benchmark_sharded(n_docs=1_000_000, n_queries=2000, k=10, executor="thread", path="sharded_rag_index"):
+    corpus = make_synthetic_documents(n_docs)
+    queries = make_synthetic_documents(n_queries, words_per_doc=5, seed=2)
+    _, reference = SimpleRAG(corpus).retrieve_many(queries, k)
+    n_cores = os.cpu_count()
+    shard_counts = sorted({2 ** i for i in range(n_cores.bit_length()) if 2 ** i <= n_cores} | {n_cores})
+    for n_shards in shard_counts:
+        sharded = ShardedRAG(corpus, n_shards=n_shards)
+        if executor == "process":
+            sharded.save(path)
+            sharded = ShardedRAG.load(path, executor="process")
+        sharded.retrieve_many(queries[:10], k)  # 預熱：建立執行緒/行程池與快取
+        start = time.perf_counter()
+        _, scores = sharded.retrieve_many(queries, k)
+        elapsed = time.perf_counter() - start
+        sharded.close()
+        print(f"{n_shards:>3} shards ({executor}): {n_queries / elapsed:8.0f} q/s, "
+              f"max score diff vs unsharded {np.abs(scores - reference).max():.2e}")
+
 # 示例使用
 documents = [
     "The sky is blue. The sun is bright.",
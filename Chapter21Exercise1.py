@@ -6,14 +6,12 @@ from qiskit.visualization import plot_histogram
 from qiskit.utils import QuantumInstance
 from qiskit.algorithms.optimizers import COBYLA
 
+import time
 import numpy as np
 import matplotlib.pyplot as plt
 import tensorflow as tf
 from tensorflow.keras import layers
-
-# Load IBM Q account
-IBMQ.load_account()
-provider = IBMQ.get_provider(hub='ibm-q')
+from QuantumSimulator import CircuitTemplate
 
 # Step 2: Quantum Generator Design
 def create_quantum_generator(params):
@@ -39,31 +37,101 @@ def create_classical_discriminator():
     return model
 
 # Step 4: Training QGAN
-def train_qgan(generator, discriminator, num_epochs=1000):
-    optimizer = COBYLA()
-    quantum_instance = QuantumInstance(backend=Aer.get_backend('qasm_simulator'), shots=1024)
+# Batched trainer: every epoch works on a minibatch of batch_size generator parameters.
+# - The generator's output distributions, plus the +-pi/2 shifted ones that give d p / d theta
+#   (parameter-shift, exact for ry), come from one batched statevector evaluation: no shots, no
+#   circuit executions.
+# - The discriminator takes one gradient step on the whole minibatch and is called directly
+#   (not through predict) for the generator loss -D(p) and its gradient with respect to p.
+# - Generator parameters persist across epochs and are updated with Adam.
+# Progress is reported every report_every epochs together with the training rate in epochs/s.
+def train_qgan(generator, discriminator, num_epochs=1000, batch_size=64, learning_rate=0.05,
+               report_every=100, seed=None):
+    rng = np.random.default_rng(seed)
+    theta = Parameter('theta')
+    template = CircuitTemplate(generator([theta]), [theta])
+    discriminator_step = make_discriminator_step(discriminator)
+    thetas = rng.random(batch_size) * np.pi
+    m = np.zeros(batch_size)
+    v = np.zeros(batch_size)
+    history = {'discriminator_loss': [], 'generator_loss': []}
 
+    start = time.perf_counter()
     for epoch in range(num_epochs):
-        # Generate data from quantum generator
+        # Generate data from quantum generator: p(theta), p(theta + pi/2), p(theta - pi/2) in one call
+        shifted = np.concatenate([thetas, thetas + np.pi / 2, thetas - np.pi / 2])[:, None]
+        probs = template.probabilities(shifted).reshape(3, batch_size, -1)
+        generated_data = probs[0].reshape(-1, 1).astype(np.float32)  # [prob_0, prob_1] per generator
+
+        # Train discriminator, then score the generated minibatch
+        real_data = rng.random(generated_data.shape).astype(np.float32)
+        d_loss, g_loss, g_loss_by_data = discriminator_step(real_data, generated_data)
+
+        # Train generator: chain rule through the parameter-shift derivatives, then an Adam step
+        gradient = np.sum(g_loss_by_data.numpy().reshape(batch_size, -1) * (probs[1] - probs[2]) / 2, axis=1)
+        m = 0.9 * m + 0.1 * gradient
+        v = 0.999 * v + 0.001 * gradient ** 2
+        thetas -= learning_rate * (m / (1 - 0.9 ** (epoch + 1))) / (np.sqrt(v / (1 - 0.999 ** (epoch + 1))) + 1e-8)
+
+        history['discriminator_loss'].append(float(d_loss))
+        history['generator_loss'].append(float(g_loss))
+        if report_every and (epoch + 1) % report_every == 0:
+            rate = (epoch + 1) / (time.perf_counter() - start)
+            print(f'Epoch {epoch + 1}: D loss: {float(d_loss):.4f}, G loss: {float(g_loss):.4f}, {rate:.1f} epochs/s')
+    history['epochs_per_second'] = num_epochs / (time.perf_counter() - start)
+    return thetas, history
+
+# One compiled training step for the discriminator on a whole minibatch (real -> 1, generated -> 0),
+# followed by the generator loss -mean(D(generated)) and its gradient with respect to the generated data
+def make_discriminator_step(discriminator):
+    bce = tf.keras.losses.BinaryCrossentropy()
+
+    @tf.function
+    def step(real_data, generated_data):
+        x = tf.concat([real_data, generated_data], axis=0)
+        y = tf.concat([tf.ones_like(real_data), tf.zeros_like(generated_data)], axis=0)
+        with tf.GradientTape() as tape:
+            d_loss = bce(y, discriminator(x, training=True))
+        gradients = tape.gradient(d_loss, discriminator.trainable_variables)
+        discriminator.optimizer.apply_gradients(zip(gradients, discriminator.trainable_variables))
+
+        with tf.GradientTape() as tape:
+            tape.watch(generated_data)
+            g_loss = -tf.reduce_mean(discriminator(generated_data, training=False))
+        return d_loss, g_loss, tape.gradient(g_loss, generated_data)
+    return step
+
+# CPU-only benchmark: epochs/s of the batched trainer for several minibatch sizes, against a few
+# epochs of the previous per-epoch loop (one Aer circuit per epoch, train_on_batch on a handful of
+# samples, COBYLA with discriminator.predict and a new circuit execution per evaluation)
+def benchmark_qgan(num_epochs=200, batch_sizes=(1, 16, 64, 256), legacy_epochs=3):
+    tf.config.set_visible_devices([], 'GPU')
+
+    discriminator = create_classical_discriminator()
+    quantum_instance = QuantumInstance(backend=Aer.get_backend('qasm_simulator'), shots=1024)
+    optimizer = COBYLA()
+
+    def execute(p):
+        return get_probabilities(quantum_instance.execute(create_quantum_generator(p)).get_counts())
+
+    start = time.perf_counter()
+    for _ in range(legacy_epochs):
         param = np.random.rand(1) * np.pi
-        qc = create_quantum_generator(param)
-        counts = quantum_instance.execute(qc).get_counts()
-        prob = get_probabilities(counts)
-        generated_data = np.array(prob).reshape(-1, 1)
-
-        # Train discriminator
-        real_data = np.random.rand(1, 1)
-        x = np.vstack([real_data, generated_data])
-        y = np.array([1, 0]).reshape(-1, 1)
+        generated_data = np.array(execute(param)).reshape(-1, 1)
+        x = np.vstack([np.random.rand(1, 1), generated_data])
+        y = np.array([1, 0, 0]).reshape(-1, 1)
         discriminator.train_on_batch(x, y)
+        loss = lambda p: -np.mean(discriminator.predict(np.array(execute(p)).reshape(-1, 1), verbose=0))
+        optimizer.minimize(loss, param)
+    print(f"{'previous loop':>16}: {legacy_epochs / (time.perf_counter() - start):8.2f} epochs/s")
 
-        # Train generator
-        loss = lambda p: -discriminator.predict(np.array(get_probabilities(quantum_instance.execute(create_quantum_generator(p)).get_counts())).reshape(-1, 1))
-        optimal_params = optimizer.minimize(loss, param)
-
-        if epoch % 100 == 0:
-            print(f'Epoch {epoch}: Loss: {loss(optimal_params)}')
+    for batch_size in batch_sizes:
+        _, history = train_qgan(create_quantum_generator, create_classical_discriminator(), num_epochs,
+                                batch_size=batch_size, report_every=0, seed=0)
+        rate = history['epochs_per_second']
+        print(f"{f'batch {batch_size}':>16}: {rate:8.2f} epochs/s, {rate * batch_size:10.0f} generator samples/s")
 
 # Main Execution
-discriminator = create_classical_discriminator()
-train_qgan(create_quantum_generator, discriminator)
+if __name__ == '__main__':
+    discriminator = create_classical_discriminator()
+    train_qgan(create_quantum_generator, discriminator)
@@ -1,13 +1,13 @@
 # Step 1: Environment Setup
 from qiskit import QuantumCircuit, Aer, transpile, assemble, IBMQ, execute
-from qiskit.circuit import Parameter
+from qiskit.circuit import Parameter, ParameterVector
 from qiskit.providers.aer import AerSimulator
 from scipy.optimize import minimize
 import numpy as np
+from QuantumSimulator import CircuitTemplate, parameter_shift_gradient, transpile_cache
 
-# Load IBM Q account
-IBMQ.load_account()
-provider = IBMQ.get_provider(hub='ibm-q')
+# The IBM Q account is only loaded for the final validation step (see the bottom of this file),
+# so importing this module needs no credentials. Training runs on the local simulator.
 
 # Step 2: Quantum Circuit Design
 def create_quantum_circuit(params, n_qubits=2):
@@ -18,6 +18,11 @@ def create_quantum_circuit(params, n_qubits=2):
     qc.measure_all()
     return qc
 
+# Parametrized template of one module: built and compiled once, then evaluated for a
+# whole batch of parameter vectors per call (see meta_learning_objective)
+module_theta = ParameterVector('theta', 4)
+module_template = CircuitTemplate(create_quantum_circuit(module_theta), module_theta)
+
 # Step 3: Modular Structure
 def create_modular_circuit(params):
     module1_params = params[:4]  # First module parameters
@@ -33,22 +38,30 @@ def transfer_learning(params, base_params, learning_rate=0.1):
     return base_params + learning_rate * (params - base_params)
 
 # Step 5: Meta-Learning Objective Function
-def meta_learning_objective(params, task_data):
-    total_loss = 0
-    for data in task_data:
-        base_params, target_state = data
-        adapted_params = transfer_learning(params, base_params)
-        qc = create_quantum_circuit(adapted_params)
-        backend = Aer.get_backend('qasm_simulator')
-        t_qc = transpile(qc, backend)
-        qobj = assemble(t_qc)
-        result = backend.run(qobj).result()
-        counts = result.get_counts()
-
-        # Calculate the negative likelihood of generating target state
-        likelihood = counts.get(target_state, 0) / sum(counts.values())
-        total_loss += -likelihood
-    return total_loss
+# backend=None uses the exact local statevector simulator; pass Aer.get_backend('qasm_simulator') to use Aer
+def meta_learning_objective(params, task_data, backend=None):
+    probabilities = module_template.probabilities(meta_learning_angles(params, task_data), backend)
+    return np.sum(meta_learning_task_loss(probabilities, task_data))
+
+# One row per task; tasks adapt the first module (base_params has 4 entries, params holds both modules)
+def meta_learning_angles(params, task_data, learning_rate=0.1):
+    return np.array([transfer_learning(params[:len(base_params)], base_params, learning_rate)
+                     for base_params, _ in task_data])
+
+# Calculate the negative likelihood of generating target state (one value per task)
+def meta_learning_task_loss(probabilities, task_data):
+    return np.array([-module_template.probability_of(probabilities[[row]], target_state)[0]
+                     for row, (_, target_state) in enumerate(task_data)])
+
+# Parameter-shift gradient of meta_learning_objective, for method='L-BFGS-B' or QuantumSimulator.adam
+def meta_learning_gradient(params, task_data, backend=None, learning_rate=0.1):
+    angles = meta_learning_angles(params, task_data, learning_rate)
+    # transfer_learning is linear: d adapted_params[j] / d params[j] = learning_rate for the first module
+    jacobian = np.zeros(angles.shape + (len(params),))
+    n_angles = angles.shape[1]
+    jacobian[:, np.arange(n_angles), np.arange(n_angles)] = learning_rate
+    return parameter_shift_gradient(module_template, angles, jacobian,
+                                    lambda probabilities: meta_learning_task_loss(probabilities, task_data), backend)
 
 # Example training data (base_params, target_state)
 task_data = [
@@ -59,24 +72,29 @@ task_data = [
 # Initial parameters for meta-learning
 params = np.random.rand(8) * 2 * np.pi
 
-# Classical optimization for meta-learning
-result = minimize(meta_learning_objective, params, args=(task_data,), method='COBYLA')
-optimized_params = result.x
-
-# Step 6: Run and Validate on IBM Quantum Computer
-qc1, qc2 = create_modular_circuit(optimized_params)
-backend = provider.get_backend('ibmq_qasm_simulator')
-t_qc1 = transpile(qc1, backend)
-t_qc2 = transpile(qc2, backend)
-qobj1 = assemble(t_qc1)
-qobj2 = assemble(t_qc2)
-job1 = backend.run(qobj1)
-job2 = backend.run(qobj2)
-result1 = job1.result()
-result2 = job2.result()
-counts1 = result1.get_counts()
-counts2 = result2.get_counts()
-
-print("Optimized Parameters:", optimized_params)
-print("Counts for Module 1:", counts1)
-print("Counts for Module 2:", counts2)
+if __name__ == '__main__':
+    # Classical optimization for meta-learning, with parameter-shift gradients
+    # (method='COBYLA' without jac for the derivative-free optimizer)
+    result = minimize(meta_learning_objective, params, args=(task_data,), method='L-BFGS-B',
+                      jac=meta_learning_gradient)
+    optimized_params = result.x
+
+    # Step 6: Run and Validate on IBM Quantum Computer
+    IBMQ.load_account()
+    provider = IBMQ.get_provider(hub='ibm-q')
+    qc1, qc2 = create_modular_circuit(optimized_params)
+    backend = provider.get_backend('ibmq_qasm_simulator')
+    t_qc1 = transpile_cache.transpile(qc1, backend)
+    t_qc2 = transpile_cache.transpile(qc2, backend)
+    qobj1 = assemble(t_qc1)
+    qobj2 = assemble(t_qc2)
+    job1 = backend.run(qobj1)
+    job2 = backend.run(qobj2)
+    result1 = job1.result()
+    result2 = job2.result()
+    counts1 = result1.get_counts()
+    counts2 = result2.get_counts()
+
+    print("Optimized Parameters:", optimized_params)
+    print("Counts for Module 1:", counts1)
+    print("Counts for Module 2:", counts2)
@@ -1,13 +1,13 @@
 # Step 1: Environment Setup
 from qiskit import QuantumCircuit, Aer, transpile, assemble, IBMQ, execute
-from qiskit.circuit import Parameter
+from qiskit.circuit import Parameter, ParameterVector
 from qiskit.providers.aer import AerSimulator
 from scipy.optimize import minimize
 import numpy as np
+from QuantumSimulator import CircuitTemplate, parameter_shift_gradient, transpile_cache
 
-# Load IBM Q account
-IBMQ.load_account()
-provider = IBMQ.get_provider(hub='ibm-q')
+# The IBM Q account is only loaded for the final validation step (see the bottom of this file),
+# so importing this module needs no credentials. Training runs on the local simulator.
 
 # Step 2: Quantum Circuit Design for Quantum Brain Simulation
 def create_quantum_brain_circuit(params, n_qubits=4):
@@ -33,6 +33,11 @@ def brain_computer_interface_simulation(params, external_input):
     qc = create_quantum_brain_circuit(adapted_params, n_qubits=4)
     return qc
 
+# Parametrized template of the brain circuit: built and compiled once, then evaluated for a
+# whole batch of parameter vectors per call (see train_quantum_brain)
+brain_theta = ParameterVector('theta', 8)
+brain_template = CircuitTemplate(create_quantum_brain_circuit(brain_theta, n_qubits=4), brain_theta)
+
 # Example training data (brain_params, external_input)
 training_data = [
     (np.random.rand(8) * 2 * np.pi, np.random.rand(8) * 0.1),
@@ -43,33 +48,43 @@ training_data = [
 params = np.random.rand(8) * 2 * np.pi
 
 # Classical optimization for brain model training
-def train_quantum_brain(params, training_data):
-    total_loss = 0
-    for data in training_data:
-        brain_params, external_input = data
-        qc = brain_computer_interface_simulation(brain_params, external_input)
-        backend = Aer.get_backend('qasm_simulator')
-        t_qc = transpile(qc, backend)
-        qobj = assemble(t_qc)
-        result = backend.run(qobj).result()
-        counts = result.get_counts()
+# backend=None uses the exact local statevector simulator; pass Aer.get_backend('qasm_simulator') to use Aer
+def train_quantum_brain(params, training_data, backend=None):
+    probabilities = brain_template.probabilities(brain_angles(training_data), backend)
+    return np.sum(brain_sample_loss(probabilities))
+
+# One row per training sample: the adapted parameters of brain_computer_interface_simulation
+def brain_angles(training_data):
+    return np.array([brain_params[:8] + external_input for brain_params, external_input in training_data])
+
+# Calculate a simple loss function based on measurement results (one value per sample)
+def brain_sample_loss(probabilities):
+    return 1 - brain_template.probability_of(probabilities, '00')
 
-        # Calculate a simple loss function based on measurement results
-        loss = 1 - counts.get('00', 0) / sum(counts.values())
-        total_loss += loss
-    return total_loss
+# Parameter-shift gradient of train_quantum_brain, for method='L-BFGS-B' or QuantumSimulator.adam.
+# The circuit angles come from training_data only, so their Jacobian with respect to params is
+# zero and so is the gradient; no shifted circuits are evaluated.
+def train_quantum_brain_gradient(params, training_data, backend=None):
+    angles = brain_angles(training_data)
+    jacobian = np.zeros(angles.shape + (len(params),))
+    return parameter_shift_gradient(brain_template, angles, jacobian, brain_sample_loss, backend)
 
-result = minimize(train_quantum_brain, params, args=(training_data,), method='COBYLA')
-optimized_params = result.x
+if __name__ == '__main__':
+    # Parameter-shift gradients with L-BFGS-B (method='COBYLA' without jac for the derivative-free optimizer)
+    result = minimize(train_quantum_brain, params, args=(training_data,), method='L-BFGS-B',
+                      jac=train_quantum_brain_gradient)
+    optimized_params = result.x
 
-# Step 5: Run and Validate on IBM Quantum Computer
-qc = create_quantum_brain_model(optimized_params)
-backend = provider.get_backend('ibmq_qasm_simulator')
-t_qc = transpile(qc, backend)
-qobj = assemble(t_qc)
-job = backend.run(qobj)
-result = job.result()
-counts = result.get_counts()
+    # Step 5: Run and Validate on IBM Quantum Computer
+    IBMQ.load_account()
+    provider = IBMQ.get_provider(hub='ibm-q')
+    qc = create_quantum_brain_model(optimized_params)
+    backend = provider.get_backend('ibmq_qasm_simulator')
+    t_qc = transpile_cache.transpile(qc, backend)
+    qobj = assemble(t_qc)
+    job = backend.run(qobj)
+    result = job.result()
+    counts = result.get_counts()
 
-print("Optimized Parameters:", optimized_params)
-print("Quantum Brain Model Counts:", counts)
+    print("Optimized Parameters:", optimized_params)
+    print("Quantum Brain Model Counts:", counts)
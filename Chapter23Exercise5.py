@@ -1,13 +1,13 @@
 # Step 1: Environment Setup
 from qiskit import QuantumCircuit, Aer, transpile, assemble, IBMQ, execute
-from qiskit.circuit import Parameter
+from qiskit.circuit import Parameter, ParameterVector
 from qiskit.providers.aer import AerSimulator
 import numpy as np
 from scipy.optimize import minimize
+from QuantumSimulator import CircuitTemplate, parameter_shift_gradient, transpile_cache
 
-# Load IBM Q account
-IBMQ.load_account()
-provider = IBMQ.get_provider(hub='ibm-q')
+# The IBM Q account is only loaded for the final validation step (see the bottom of this file),
+# so importing this module needs no credentials. Training runs on the local simulator.
 
 # Step 2: Quantum Circuit Design for Emotional Understanding and Creativity Simulation
 def create_emotion_creativity_circuit(params, n_qubits=6):
@@ -25,6 +25,11 @@ def create_emotion_creativity_circuit(params, n_qubits=6):
     qc.measure_all()
     return qc
 
+# Parametrized template shared by the emotion and creativity models: built and compiled once,
+# then evaluated for a whole batch of parameter vectors per call (see train_emotion_creativity)
+emotion_theta = ParameterVector('theta', 6)
+emotion_template = CircuitTemplate(create_emotion_creativity_circuit(emotion_theta, n_qubits=6), emotion_theta)
+
 # Step 3: Implementing Emotional Understanding
 def create_emotion_model(params):
     emotion_params = params[:6]  # Parameters for emotional model
@@ -48,56 +53,58 @@ training_data = [
 params = np.random.rand(12) * 2 * np.pi
 
 # Classical optimization for emotion and creativity model training
-def train_emotion_creativity(params, training_data):
-    total_loss = 0
-    for data in training_data:
-        emotion_params, creativity_params = data
-        qc_emotion = create_emotion_model(emotion_params)
-        qc_creativity = create_creativity_model(creativity_params, np.random.rand(6) * 0.1)
-        
-        backend = Aer.get_backend('qasm_simulator')
-        t_qc_emotion = transpile(qc_emotion, backend)
-        t_qc_creativity = transpile(qc_creativity, backend)
-        
-        qobj_emotion = assemble(t_qc_emotion)
-        qobj_creativity = assemble(t_qc_creativity)
-        
-        result_emotion = backend.run(qobj_emotion).result()
-        result_creativity = backend.run(qobj_creativity).result()
-        
-        counts_emotion = result_emotion.get_counts()
-        counts_creativity = result_creativity.get_counts()
-
-        # Calculate a simple loss function based on measurement results
-        loss_emotion = 1 - counts_emotion.get('000000', 0) / sum(counts_emotion.values())
-        loss_creativity = 1 - counts_creativity.get('000000', 0) / sum(counts_creativity.values())
-        
-        total_loss += loss_emotion + loss_creativity
-    return total_loss
-
-result = minimize(train_emotion_creativity, params, args=(training_data,), method='COBYLA')
-optimized_params = result.x
-
-# Step 5: Run and Validate on IBM Quantum Computer
-qc_emotion = create_emotion_model(optimized_params[:6])
-qc_creativity = create_creativity_model(optimized_params[6:], np.random.rand(6) * 0.1)
-
-backend = provider.get_backend('ibmq_qasm_simulator')
-t_qc_emotion = transpile(qc_emotion, backend)
-t_qc_creativity = transpile(qc_creativity, backend)
-
-qobj_emotion = assemble(t_qc_emotion)
-qobj_creativity = assemble(t_qc_creativity)
-
-job_emotion = backend.run(qobj_emotion)
-job_creativity = backend.run(qobj_creativity)
-
-result_emotion = job_emotion.result()
-result_creativity = job_creativity.result()
-
-counts_emotion = result_emotion.get_counts()
-counts_creativity = result_creativity.get_counts()
-
-print("Optimized Parameters:", optimized_params)
-print("Emotion Model Counts:", counts_emotion)
-print("Creativity Model Counts:", counts_creativity)
+# backend=None uses the exact local statevector simulator; pass Aer.get_backend('qasm_simulator') to use Aer
+def train_emotion_creativity(params, training_data, backend=None):
+    probabilities = emotion_template.probabilities(emotion_creativity_angles(training_data), backend)
+    return np.sum(emotion_creativity_sample_loss(probabilities))
+
+# One batch for both models: emotion rows (create_emotion_model) followed by
+# creativity rows (create_creativity_model with a random external input)
+def emotion_creativity_angles(training_data):
+    emotion_rows = [emotion_params[:6] for emotion_params, _ in training_data]
+    creativity_rows = [creativity_params + np.random.rand(6) * 0.1 for _, creativity_params in training_data]
+    return np.array(emotion_rows + creativity_rows)
+
+# Calculate a simple loss function based on measurement results (one value per row)
+def emotion_creativity_sample_loss(probabilities):
+    return 1 - emotion_template.probability_of(probabilities, '000000')
+
+# Parameter-shift gradient of train_emotion_creativity, for method='L-BFGS-B' or QuantumSimulator.adam.
+# The circuit angles come from training_data (plus random input) only, so their Jacobian with
+# respect to params is zero and so is the gradient; no shifted circuits are evaluated.
+def train_emotion_creativity_gradient(params, training_data, backend=None):
+    angles = emotion_creativity_angles(training_data)
+    jacobian = np.zeros(angles.shape + (len(params),))
+    return parameter_shift_gradient(emotion_template, angles, jacobian, emotion_creativity_sample_loss, backend)
+
+if __name__ == '__main__':
+    # Parameter-shift gradients with L-BFGS-B (method='COBYLA' without jac for the derivative-free optimizer)
+    result = minimize(train_emotion_creativity, params, args=(training_data,), method='L-BFGS-B',
+                      jac=train_emotion_creativity_gradient)
+    optimized_params = result.x
+
+    # Step 5: Run and Validate on IBM Quantum Computer
+    IBMQ.load_account()
+    provider = IBMQ.get_provider(hub='ibm-q')
+    qc_emotion = create_emotion_model(optimized_params[:6])
+    qc_creativity = create_creativity_model(optimized_params, np.random.rand(6) * 0.1)
+
+    backend = provider.get_backend('ibmq_qasm_simulator')
+    t_qc_emotion = transpile_cache.transpile(qc_emotion, backend)
+    t_qc_creativity = transpile_cache.transpile(qc_creativity, backend)
+
+    qobj_emotion = assemble(t_qc_emotion)
+    qobj_creativity = assemble(t_qc_creativity)
+
+    job_emotion = backend.run(qobj_emotion)
+    job_creativity = backend.run(qobj_creativity)
+
+    result_emotion = job_emotion.result()
+    result_creativity = job_creativity.result()
+
+    counts_emotion = result_emotion.get_counts()
+    counts_creativity = result_creativity.get_counts()
+
+    print("Optimized Parameters:", optimized_params)
+    print("Emotion Model Counts:", counts_emotion)
+    print("Creativity Model Counts:", counts_creativity)
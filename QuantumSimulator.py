@@ -0,0 +1,520 @@
+# Local NumPy statevector simulator for the chapter circuits
+# (Chapter21Exercise2, Chapter22Exercise, Chapter23Exercise3, Chapter23Exercise5).
+# No IBMQ account and no Aer needed: circuits are built with qiskit's QuantumCircuit as before,
+# then simulated here. Supported instructions: rx, ry, h, cx, cz, measure (terminal only), barrier.
+#
+# shots=None  -> exact mode: get_counts() returns the exact outcome probabilities
+#                (same dict format, values sum to 1, so counts.get(k, 0) / sum(counts.values()) still works)
+# shots=1024  -> sampling mode: one multinomial draw per circuit, integer counts like Aer
+import hashlib
+import os
+import threading
+import time
+import numpy as np
+
+_H = np.array([[1, 1], [1, -1]], dtype=complex) / np.sqrt(2)
+
+def _rx(theta):
+    # theta: shape (batch,) -> (batch, 2, 2)
+    c, s = np.cos(theta / 2), np.sin(theta / 2)
+    return np.stack([np.stack([c, -1j * s], -1), np.stack([-1j * s, c], -1)], -2)
+
+def _ry(theta):
+    c, s = np.cos(theta / 2), np.sin(theta / 2)
+    return np.stack([np.stack([c, -s], -1), np.stack([s, c], -1)], -2).astype(complex)
+
+_ROTATIONS = {'rx': _rx, 'ry': _ry}
+
+# A QuantumCircuit flattened into a gate list of (name, qubit indices, angles) plus the
+# qubit -> clbit measurement map. The state is stored as an array of shape (batch, 2, ..., 2)
+# where axis n_qubits - q holds qubit q, so flattening gives qiskit's little-endian basis index.
+# Angles may be unbound Parameters listed in `parameters`; they are stored as column indices
+# and read from the (batch, len(parameters)) `values` array at evaluation time.
+class CompiledCircuit:
+    def __init__(self, circuit, parameters=()):
+        self.n_qubits = circuit.num_qubits
+        self.n_clbits = circuit.num_clbits
+        self.creg_sizes = [creg.size for creg in circuit.cregs]
+        self.parameters = list(parameters)
+        columns = {parameter: i for i, parameter in enumerate(self.parameters)}
+        self.ops = []
+        self.measurements = {}
+        for instruction in circuit.data:
+            name = instruction.operation.name
+            qubits = tuple(circuit.find_bit(qubit).index for qubit in instruction.qubits)
+            if name == 'barrier':
+                continue
+            if name == 'measure':
+                self.measurements[qubits[0]] = circuit.find_bit(instruction.clbits[0]).index
+                continue
+            if name not in _ROTATIONS and name not in ('h', 'cx', 'cz'):
+                raise ValueError(f"unsupported instruction {name!r}")
+            if any(qubit in self.measurements for qubit in qubits):
+                raise ValueError("only terminal measurements are supported")
+            angles = []
+            for param in instruction.operation.params:
+                if param in columns:
+                    angles.append(columns[param])
+                else:
+                    # float() raises for parameters that are neither bound nor listed in `parameters`
+                    angles.append(float(param))
+            self.ops.append((name, qubits, angles))
+        basis = np.arange(2 ** self.n_qubits)
+        self._outcomes = np.zeros(2 ** self.n_qubits, dtype=np.int64)
+        for qubit, clbit in self.measurements.items():
+            self._outcomes |= ((basis >> qubit) & 1) << clbit
+
+    def statevector(self, values=None, batch=1):
+        if values is not None:
+            values = np.asarray(values, dtype=float).reshape(-1, len(self.parameters))
+            batch = len(values)
+        n = self.n_qubits
+        state = np.zeros((batch,) + (2,) * n, dtype=complex)
+        state[(slice(None),) + (0,) * n] = 1
+        for name, qubits, angles in self.ops:
+            axes = [n - qubit for qubit in qubits]
+            if name in _ROTATIONS:
+                angle = angles[0]
+                theta = values[:, angle] if isinstance(angle, int) else np.full(batch, angle)
+                state = _apply_1q(state, _ROTATIONS[name](theta), axes[0])
+            elif name == 'h':
+                state = _apply_1q(state, _H, axes[0])
+            else:
+                state = np.moveaxis(state, axes, [1, 2])
+                if name == 'cx':
+                    state[:, 1] = state[:, 1, ::-1].copy()
+                else:
+                    state[:, 1, 1] *= -1
+                state = np.moveaxis(state, [1, 2], axes)
+        return state.reshape(batch, -1)
+
+    def probabilities(self, values=None, batch=1):
+        # (batch, 2**n_clbits) outcome probabilities over the measured classical bits;
+        # column i is the outcome whose counts key is key(i)
+        probs = np.abs(self.statevector(values, batch)) ** 2
+        if self.n_clbits == self.n_qubits and np.array_equal(self._outcomes, np.arange(len(self._outcomes))):
+            return probs
+        marginal = np.zeros((probs.shape[0], 2 ** self.n_clbits))
+        for row in range(probs.shape[0]):
+            marginal[row] = np.bincount(self._outcomes, weights=probs[row], minlength=2 ** self.n_clbits)
+        return marginal
+
+    def key(self, outcome):
+        # qiskit counts key: highest clbit first, registers separated by spaces
+        bits = format(outcome, f'0{self.n_clbits}b') if self.n_clbits else ''
+        if len(self.creg_sizes) <= 1:
+            return bits
+        parts, end = [], len(bits)
+        for size in self.creg_sizes:
+            parts.append(bits[end - size:end])
+            end -= size
+        return ' '.join(reversed(parts))
+
+    def key_index(self, key):
+        # Column of `key` in probabilities(), or None if it is not an outcome of this circuit
+        bits = key.replace(' ', '')
+        if len(bits) != self.n_clbits or self.key(int(bits or '0', 2)) != key:
+            return None
+        return int(bits or '0', 2)
+
+def _apply_1q(state, matrix, axis):
+    # matrix: (2, 2), or (batch, 2, 2) for one matrix per batch row
+    state = np.moveaxis(state, axis, -1)
+    flat = state.reshape(state.shape[0], -1, 2)
+    if matrix.ndim == 2:
+        flat = flat @ matrix.T
+    else:
+        flat = np.einsum('bij,bmj->bmi', matrix, flat)
+    return np.moveaxis(flat.reshape(state.shape), -1, axis)
+
+class StatevectorResult:
+    def __init__(self, counts):
+        self._counts = counts
+
+    def result(self):
+        # backend.run(...).result() as with Aer jobs
+        return self
+
+    def get_counts(self, experiment=None):
+        if experiment is None:
+            return self._counts[0] if len(self._counts) == 1 else list(self._counts)
+        return self._counts[experiment]
+
+class StatevectorSimulator:
+    def __init__(self, shots=None, seed=None):
+        self.shots = shots
+        self.rng = np.random.default_rng(seed)
+
+    def run(self, circuits, shots=...):
+        shots = self.shots if shots is ... else shots
+        if not isinstance(circuits, (list, tuple)):
+            circuits = [circuits]
+        return StatevectorResult([self._counts(CompiledCircuit(circuit), shots) for circuit in circuits])
+
+    def _counts(self, compiled, shots):
+        probs = compiled.probabilities()[0]
+        if shots is None:
+            return {compiled.key(i): float(probs[i]) for i in np.flatnonzero(probs)}
+        samples = self.rng.multinomial(shots, probs / probs.sum())
+        return {compiled.key(i): int(samples[i]) for i in np.flatnonzero(samples)}
+
+exact_simulator = StatevectorSimulator()
+
+# Process-wide transpilation cache. Circuits that differ only in their angles share one entry,
+# keyed on a structural fingerprint: gate names, qubit/clbit indices, register layout and the
+# backend target (name, basis gates, coupling map). On a miss every angle is replaced by a
+# placeholder Parameter and that template is transpiled; on every call the circuit's own
+# angles (floats, or Parameters for CircuitTemplate) are bound into the transpiled template.
+# With `path` set, transpiled templates are also stored as QPY files and reused across runs.
+class TranspileCache:
+    def __init__(self, path=None, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'transpile_seconds': 0.0}
+
+    def transpile(self, circuit, backend):
+        from qiskit import transpile
+        if not self.enabled:
+            return transpile(circuit, backend)
+        t_qc, slots = self.template(circuit, backend)
+        angles = [param for instruction in circuit.data for param in instruction.operation.params]
+        return t_qc.assign_parameters({slot: angle for slot, angle in zip(slots, angles) if slot is not None})
+
+    def template(self, circuit, backend):
+        # (transpiled template, placeholder per angle slot; None where transpile removed the slot)
+        key = self.fingerprint(circuit, backend)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.stats['hits'] += 1
+                return entry
+        entry = self._load(key)
+        if entry is not None:
+            self.stats['disk_hits'] += 1
+        else:
+            entry = self._transpile_template(circuit, backend)
+            self.stats['misses'] += 1
+            self._save(key, entry[0], len(entry[1]))
+        with self._lock:
+            return self._entries.setdefault(key, entry)
+
+    @staticmethod
+    def fingerprint(circuit, backend):
+        structure = [_backend_target(backend), circuit.num_qubits,
+                     [(creg.name, creg.size) for creg in circuit.cregs]]
+        for instruction in circuit.data:
+            structure.append((instruction.operation.name,
+                              [circuit.find_bit(qubit).index for qubit in instruction.qubits],
+                              [circuit.find_bit(clbit).index for clbit in instruction.clbits],
+                              len(instruction.operation.params)))
+        return hashlib.sha256(repr(structure).encode()).hexdigest()
+
+    def _transpile_template(self, circuit, backend):
+        from qiskit import transpile
+        from qiskit.circuit import ParameterVector
+        n_slots = sum(len(instruction.operation.params) for instruction in circuit.data)
+        slots = ParameterVector('_slot', n_slots)
+        template = circuit.copy_empty_like()
+        slot = 0
+        for instruction in circuit.data:
+            operation = instruction.operation
+            if operation.params:
+                operation = operation.copy()
+                operation.params = list(slots[slot:slot + len(operation.params)])
+                slot += len(operation.params)
+            template.append(operation, instruction.qubits, instruction.clbits)
+        start = time.perf_counter()
+        t_qc = transpile(template, backend)
+        self.stats['transpile_seconds'] += time.perf_counter() - start
+        return t_qc, _slot_parameters(t_qc, n_slots)
+
+    def _load(self, key):
+        if self.path is None or not os.path.exists(os.path.join(self.path, key + '.qpy')):
+            return None
+        from qiskit import qpy
+        with open(os.path.join(self.path, key + '.qpy'), 'rb') as f:
+            t_qc = qpy.load(f)[0]
+        n_slots = int(t_qc.metadata['n_slots'])
+        return t_qc, _slot_parameters(t_qc, n_slots)
+
+    def _save(self, key, t_qc, n_slots):
+        if self.path is None:
+            return
+        from qiskit import qpy
+        os.makedirs(self.path, exist_ok=True)
+        t_qc.metadata = dict(t_qc.metadata or {}, n_slots=n_slots)
+        # write to a temporary file and rename, so a concurrent run never reads a partial file
+        tmp_path = os.path.join(self.path, f'{key}.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            qpy.dump(t_qc, f)
+        os.replace(tmp_path, os.path.join(self.path, key + '.qpy'))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def _backend_target(backend):
+    name = backend.name() if callable(backend.name) else backend.name
+    try:
+        configuration = backend.configuration()
+    except AttributeError:
+        return (name,)
+    return (name, tuple(configuration.basis_gates), str(configuration.coupling_map))
+
+def _slot_parameters(t_qc, n_slots):
+    by_name = {parameter.name: parameter for parameter in t_qc.parameters}
+    return [by_name.get(f'_slot[{i}]') for i in range(n_slots)]
+
+# Shared by run_counts, CircuitTemplate and the chapters' validation steps.
+# Set transpile_cache.path (e.g. '.transpile_cache') to keep transpiled templates across runs.
+transpile_cache = TranspileCache()
+
+# Parametrized circuit template: the circuit is built once with Parameter placeholders and
+# compiled once (transpiled once per Aer backend), then evaluated for a whole
+# (batch, len(parameters)) array of parameter values in one call.
+#
+# probabilities(values, backend) returns a (batch, 2**n_clbits) tensor: exact probabilities on an
+# exact StatevectorSimulator, sampled frequencies (counts / shots) on a sampling one or on Aer,
+# where all bindings go to Aer in a single backend.run(..., parameter_binds=...) call.
+class CircuitTemplate:
+    def __init__(self, circuit, parameters):
+        self.circuit = circuit
+        self.parameters = list(parameters)
+        self.compiled = CompiledCircuit(circuit, self.parameters)
+        self._transpiled = {}
+        self.stats = {'calls': 0, 'circuits': 0}
+
+    def probabilities(self, values, backend=None):
+        values = np.asarray(values, dtype=float).reshape(-1, len(self.parameters))
+        self.stats['calls'] += 1
+        self.stats['circuits'] += len(values)
+        backend = exact_simulator if backend is None else backend
+        if isinstance(backend, StatevectorSimulator):
+            if backend.shots is None:
+                return self.compiled.probabilities(values)
+            return self.counts(values, backend.shots, backend.rng) / backend.shots
+        return self._aer_counts(values, backend) / backend.options.shots
+
+    def counts(self, values, shots=1024, rng=None):
+        # (batch, 2**n_clbits) integer counts, one multinomial draw per row
+        rng = rng if rng is not None else np.random.default_rng()
+        probs = self.compiled.probabilities(values)
+        return rng.multinomial(shots, probs / probs.sum(axis=1, keepdims=True))
+
+    @property
+    def shift_columns(self):
+        # Columns of `parameters` that drive a rotation gate (the ones parameter-shift has to shift)
+        columns = [angles[0] for name, _, angles in self.compiled.ops
+                   if name in _ROTATIONS and isinstance(angles[0], int)]
+        uses = np.bincount(columns, minlength=len(self.parameters))
+        if np.any(uses > 1):
+            raise ValueError("parameter-shift needs each Parameter in at most one rotation gate")
+        return np.flatnonzero(uses)
+
+    def probability_of(self, probabilities, key):
+        # probabilities[:, key] like counts.get(key, 0) / shots: zeros if key is not an outcome
+        index = self.compiled.key_index(key)
+        if index is None:
+            return np.zeros(len(probabilities))
+        return probabilities[:, index]
+
+    def _aer_counts(self, values, backend):
+        name = backend.name() if callable(backend.name) else backend.name
+        t_qc = self._transpiled.get(name)
+        if t_qc is None:
+            t_qc = self._transpiled[name] = transpile_cache.transpile(self.circuit, backend)
+        used = [i for i, parameter in enumerate(self.parameters) if parameter in t_qc.parameters]
+        binds = [{self.parameters[i]: values[:, i].tolist() for i in used}]
+        result = backend.run(t_qc, parameter_binds=binds).result()
+        counts = np.zeros((len(values), 2 ** self.compiled.n_clbits), dtype=np.int64)
+        for row in range(len(values)):
+            for key, count in result.get_counts(row).items():
+                counts[row, int(key.replace(' ', ''), 2)] = count
+        return counts
+
+# Parameter-shift gradient for a loss built on a CircuitTemplate.
+# angles: (rows, len(template.parameters)) angle rows the loss evaluates;
+# angles_jacobian: (rows, len(template.parameters), n_params) derivative of those angles w.r.t. the
+# trainable params; row_loss(probabilities) -> (rows,) per-row loss, linear in each row's
+# probabilities (true for every chapter loss: 1 - p(key), -p(target)).
+# For rx/ry, d p / d theta = (p(theta + pi/2) - p(theta - pi/2)) / 2 exactly, so the gradient needs
+# two shifted evaluations per angle column; all of them go to the backend in a single batched call.
+# Columns whose Jacobian is zero are not shifted.
+def parameter_shift_gradient(template, angles, angles_jacobian, row_loss, backend=None):
+    angles = np.asarray(angles, dtype=float)
+    angles_jacobian = np.asarray(angles_jacobian, dtype=float)
+    columns = [j for j in template.shift_columns if np.any(angles_jacobian[:, j])]
+    if not columns:
+        return np.zeros(angles_jacobian.shape[2])
+    shifted = np.broadcast_to(angles, (2, len(columns)) + angles.shape).copy()
+    for c, j in enumerate(columns):
+        shifted[0, c, :, j] += np.pi / 2
+        shifted[1, c, :, j] -= np.pi / 2
+    probabilities = template.probabilities(shifted.reshape(-1, angles.shape[1]), backend)
+    probabilities = probabilities.reshape(2, len(columns), len(angles), -1)
+    angle_gradient = np.array([(row_loss(probabilities[0, c]) - row_loss(probabilities[1, c])) / 2
+                               for c in range(len(columns))])
+    return np.einsum('cr,rcp->p', angle_gradient, angles_jacobian[:, columns, :])
+
+# Adam as a scipy.optimize.minimize method: minimize(fun, x0, args, method=adam, jac=gradient)
+def adam(fun, x0, args=(), jac=None, lr=0.05, beta1=0.9, beta2=0.999, eps=1e-8,
+         maxiter=500, gtol=1e-6, callback=None, **unknown_options):
+    from scipy.optimize import OptimizeResult
+    x = np.array(x0, dtype=float)
+    m = np.zeros_like(x)
+    v = np.zeros_like(x)
+    success = False
+    nit = 0
+    for nit in range(1, maxiter + 1):
+        gradient = jac(x, *args)
+        if np.linalg.norm(gradient, np.inf) < gtol:
+            success = True
+            break
+        m = beta1 * m + (1 - beta1) * gradient
+        v = beta2 * v + (1 - beta2) * gradient ** 2
+        x -= lr * (m / (1 - beta1 ** nit)) / (np.sqrt(v / (1 - beta2 ** nit)) + eps)
+        if callback is not None:
+            callback(x)
+    return OptimizeResult(x=x, fun=fun(x, *args), nit=nit, nfev=1, njev=nit, success=success,
+                          message='gradient below gtol' if success else 'maxiter reached')
+
+# Run one circuit and return its counts. backend=None uses the exact local simulator;
+# any other backend (e.g. Aer.get_backend('qasm_simulator')) goes through transpile_cache/assemble.
+def run_counts(circuit, backend=None):
+    backend = exact_simulator if backend is None else backend
+    if isinstance(backend, StatevectorSimulator):
+        return backend.run(circuit).result().get_counts()
+    from qiskit import assemble
+    t_qc = transpile_cache.transpile(circuit, backend)
+    qobj = assemble(t_qc)
+    return backend.run(qobj).result().get_counts()
+
+# Benchmark: time per objective evaluation with the exact simulator, the sampling simulator and Aer
+def benchmark_objective(objective, params, data, n_evals=20):
+    backends = {'statevector (exact)': StatevectorSimulator(),
+                'statevector (1024 shots)': StatevectorSimulator(shots=1024)}
+    try:
+        from qiskit import Aer
+        backends['aer qasm_simulator'] = Aer.get_backend('qasm_simulator')
+    except ImportError:
+        pass
+    for label, backend in backends.items():
+        objective(params, data, backend=backend)  # warm-up
+        start = time.perf_counter()
+        for _ in range(n_evals):
+            loss = objective(params, data, backend=backend)
+        elapsed = (time.perf_counter() - start) / n_evals
+        print(f"{objective.__name__:>26} {label:>25}: {elapsed * 1000:8.2f} ms/eval, loss {loss:.4f}")
+
+def benchmark_chapter_objectives(n_evals=20):
+    import Chapter21Exercise2
+    import Chapter22Exercise
+    import Chapter23Exercise3
+    import Chapter23Exercise5
+    benchmark_objective(Chapter21Exercise2.meta_learning_objective, Chapter21Exercise2.params,
+                        Chapter21Exercise2.task_data, n_evals)
+    benchmark_objective(Chapter22Exercise.train_quantum_brain, Chapter22Exercise.params,
+                        Chapter22Exercise.training_data, n_evals)
+    benchmark_objective(Chapter23Exercise3.train_biblical_ethics, Chapter23Exercise3.params,
+                        Chapter23Exercise3.training_data, n_evals)
+    benchmark_objective(Chapter23Exercise5.train_emotion_creativity, Chapter23Exercise5.params,
+                        Chapter23Exercise5.training_data, n_evals)
+
+# Benchmark: parameter vectors evaluated per second, building and running one circuit per vector
+# (run_counts) versus one batched CircuitTemplate.probabilities call for the whole batch
+def benchmark_template(build_circuit, n_params, batch_sizes=(1, 16, 256), n_evals=5, backend=None):
+    from qiskit.circuit import ParameterVector
+    theta = ParameterVector('theta', n_params)
+    template = CircuitTemplate(build_circuit(theta), theta)
+    rng = np.random.default_rng(0)
+    for batch_size in batch_sizes:
+        values = rng.uniform(0, 2 * np.pi, (batch_size, n_params))
+        start = time.perf_counter()
+        for _ in range(n_evals):
+            for row in values:
+                run_counts(build_circuit(row), backend)
+        per_circuit = batch_size * n_evals / (time.perf_counter() - start)
+        template.probabilities(values, backend)  # warm-up (transpiles once for Aer)
+        start = time.perf_counter()
+        for _ in range(n_evals):
+            template.probabilities(values, backend)
+        batched = batch_size * n_evals / (time.perf_counter() - start)
+        print(f"{build_circuit.__name__:>34} batch {batch_size:>4}: per-circuit {per_circuit:9.0f} evals/s, "
+              f"template {batched:9.0f} evals/s ({batched / per_circuit:.0f}x)")
+
+def benchmark_chapter_templates(batch_sizes=(1, 16, 256), backend=None):
+    import Chapter21Exercise2
+    import Chapter22Exercise
+    import Chapter23Exercise3
+    import Chapter23Exercise5
+    benchmark_template(Chapter21Exercise2.create_quantum_circuit, 4, batch_sizes, backend=backend)
+    benchmark_template(Chapter22Exercise.create_quantum_brain_circuit, 8, batch_sizes, backend=backend)
+    benchmark_template(Chapter23Exercise3.create_ethical_decision_circuit, 8, batch_sizes, backend=backend)
+    benchmark_template(Chapter23Exercise5.create_emotion_creativity_circuit, 6, batch_sizes, backend=backend)
+
+# Benchmark: wall-clock time of minimize(COBYLA) on a per-circuit objective that builds and runs
+# one circuit per task on Aer (the pre-template pattern), with the transpile cache off and on
+def benchmark_transpile_cache(maxiter=100, path=None):
+    from scipy.optimize import minimize
+    from qiskit import Aer
+    import Chapter21Exercise2
+    backend = Aer.get_backend('qasm_simulator')
+
+    def per_circuit_objective(params, task_data):
+        total_loss = 0
+        for base_params, target_state in task_data:
+            adapted_params = Chapter21Exercise2.transfer_learning(params[:len(base_params)], base_params)
+            counts = run_counts(Chapter21Exercise2.create_quantum_circuit(adapted_params), backend)
+            total_loss -= counts.get(target_state, 0) / sum(counts.values())
+        return total_loss
+
+    global transpile_cache
+    previous = transpile_cache
+    try:
+        runs = [('no cache', TranspileCache(enabled=False)), ('cache', TranspileCache(path))]
+        if path is not None:
+            # a fresh cache instance stands in for a new process reading the QPY files
+            runs.append(('cache (warm from disk)', TranspileCache(path)))
+        for label, cache in runs:
+            transpile_cache = cache
+            start = time.perf_counter()
+            result = minimize(per_circuit_objective, Chapter21Exercise2.params,
+                              args=(Chapter21Exercise2.task_data,), method='COBYLA', options={'maxiter': maxiter})
+            elapsed = time.perf_counter() - start
+            print(f"{label:>22}: {elapsed:6.2f} s for {result.nfev} evaluations, "
+                  f"hits {cache.stats['hits']}, disk hits {cache.stats['disk_hits']}, "
+                  f"misses {cache.stats['misses']}, transpile {cache.stats['transpile_seconds']:.3f} s")
+    finally:
+        transpile_cache = previous
+
+# Benchmark: COBYLA versus L-BFGS-B and Adam with parameter-shift gradients on each chapter's
+# objective (exact local simulator): wall-clock time, final loss, objective/gradient calls and
+# circuits evaluated (rows sent to the template, shifted circuits included)
+def benchmark_optimizers():
+    from scipy.optimize import minimize
+    import Chapter21Exercise2
+    import Chapter22Exercise
+    import Chapter23Exercise3
+    import Chapter23Exercise5
+    chapters = [
+        (Chapter21Exercise2.meta_learning_objective, Chapter21Exercise2.meta_learning_gradient,
+         Chapter21Exercise2.module_template, Chapter21Exercise2.params, Chapter21Exercise2.task_data),
+        (Chapter22Exercise.train_quantum_brain, Chapter22Exercise.train_quantum_brain_gradient,
+         Chapter22Exercise.brain_template, Chapter22Exercise.params, Chapter22Exercise.training_data),
+        (Chapter23Exercise3.train_biblical_ethics, Chapter23Exercise3.train_biblical_ethics_gradient,
+         Chapter23Exercise3.ethics_template, Chapter23Exercise3.params, Chapter23Exercise3.training_data),
+        (Chapter23Exercise5.train_emotion_creativity, Chapter23Exercise5.train_emotion_creativity_gradient,
+         Chapter23Exercise5.emotion_template, Chapter23Exercise5.params, Chapter23Exercise5.training_data),
+    ]
+    for objective, gradient, template, params, data in chapters:
+        for label, options in (('COBYLA', {'method': 'COBYLA'}),
+                               ('L-BFGS-B + shift', {'method': 'L-BFGS-B', 'jac': gradient}),
+                               ('adam + shift', {'method': adam, 'jac': gradient})):
+            template.stats.update(calls=0, circuits=0)
+            start = time.perf_counter()
+            result = minimize(objective, params, args=(data,), **options)
+            elapsed = time.perf_counter() - start
+            print(f"{objective.__name__:>24} {label:>16}: {elapsed * 1000:8.1f} ms, loss {result.fun:8.4f}, "
+                  f"nfev {result.nfev:4}, njev {result.get('njev', 0):4}, circuits {template.stats['circuits']:6}")